@@ -6,6 +6,10 @@ from typing import Union
 import httpx
 import pandas as pd
 from bs4 import BeautifulSoup
+from details import extract_product_details
+from details import ProductDetails
+from images import ImageCache
+from matrix import PriceMatrix
 from playwright.sync_api import sync_playwright
 from rich.console import Console
 from rich.table import Table
@@ -47,25 +51,25 @@ class BulkBarn:
         for cat in self.categories:
             if category:
                 if cat["name"] == category:
-                    response = self.client.get(cat["url"])
-                    soup = BeautifulSoup(response.text, "html.parser")
-                    product_elements = soup.find_all("li", class_="prod-thumbnail")
-
-                    for element in product_elements:
-                        if product := self.parse_product_element(element):
-                            products.append(product)
+                    products.extend(self.get_category_products(cat["url"]))
                     break
             else:
-                response = self.client.get(cat["url"])
-                soup = BeautifulSoup(response.text, "html.parser")
-                product_elements = soup.find_all("li", class_="prod-thumbnail")
-
-                for element in product_elements:
-                    if product := self.parse_product_element(element):
-                        products.append(product)
+                products.extend(self.get_category_products(cat["url"]))
         self.products = products
         return products
 
+    def get_category_products(self, url: str) -> List[Dict[str, Union[str, int]]]:
+        """Get the products listed on a category page."""
+        response = self.client.get(url)
+        soup = BeautifulSoup(response.text, "html.parser")
+        product_elements = soup.find_all("li", class_="prod-thumbnail")
+
+        products = []
+        for element in product_elements:
+            if product := self.parse_product_element(element):
+                products.append(product)
+        return products
+
     @staticmethod
     def parse_product_element(element) -> Union[Dict[str, Union[str, int]], None]:
         link = element.find("a", class_="product_thumbnail_item")
@@ -107,207 +111,19 @@ class BulkBarn:
         products_df = pd.DataFrame(self.products)
         products_df.to_csv(file_name, index=False)
 
-    def get_products_details(self, url: str) -> Dict[str, Union[str, int]]:
+    def get_products_details(self, url: str) -> ProductDetails:
+        """Get the details of a product, see details.DetailExtractor."""
         response = self.client.get(url)
-
-        soup = BeautifulSoup(response.text, "html.parser")
-
-        # get all the images urls
-        image = soup.find("section", {"id": "products-content"}).find(
-            "li", class_="normalscale centered blowup currentDisplayItem"
+        return extract_product_details(response.text)
+
+    def download_images(
+        self, details: List[Dict[str, Union[str, int]]], path: str = "images"
+    ) -> Dict[str, str]:
+        """Download the images of get_products_details results, see ImageCache."""
+        return ImageCache(self.client, path).download(
+            detail["image"] for detail in details
         )
 
-        image_url = "image['data-blowup-content']"
-
-        product_redbox = soup.find("section", {"id": "products-content"}).find_all(
-            "div", class_="greystripe product-detail-card [nutrition-status]"
-        )[1]
-
-        product_name = product_redbox.find("p", class_="prod-name").text.strip()
-        product_bbplu = product_redbox.find("p", class_="prod-desc").text.strip()
-        product_price = product_redbox.find("p", class_="prod-price").text.strip()
-        # get product details
-
-        def extract_text(element):
-            return element.text.strip() if element else ""
-
-        details = {
-            "Dietary Information": {
-                "Organic": extract_text(
-                    product_redbox.find("li", class_="list-ind-organic")
-                ),
-                "Peanut Free": extract_text(
-                    product_redbox.find("li", class_="list-ind-peanutfree")
-                ),
-                "Vegan": extract_text(
-                    product_redbox.find("li", class_="list-ind-vegan")
-                ),
-                "Gluten-Free": extract_text(
-                    product_redbox.find("li", class_="list-ind-glutenfree")
-                ),
-                "Dairy Free": extract_text(
-                    product_redbox.find("li", class_="list-ind-dairyfree")
-                ),
-                "Non GMO": extract_text(
-                    product_redbox.find("li", class_="list-ind-nongmo")
-                ),
-            },
-            "Ingredients": extract_text(product_redbox.find("p", class_="prod-ing")),
-            "Allergens": extract_text(product_redbox.find("p", class_="prod-algn")),
-            "Directions for Use": extract_text(
-                product_redbox.find("p", class_="prod-dir")
-            ),
-            "Usage Tips": extract_text(product_redbox.find("p", class_="prod-use")),
-            "Storage Tips": extract_text(product_redbox.find("p", class_="prod-store")),
-            "Points of Interest": extract_text(
-                product_redbox.find("p", class_="prod-poi")
-            ),
-            "Other": extract_text(product_redbox.find("p", class_="prod-other")),
-        }
-
-        # get nutrition facts
-        nutrition_facts = {
-            "Serving Size": "",
-            "Portion": "",
-            "Calories": "",
-            "Fat": {
-                "Total": {"Value": "", "Percentage": ""},
-                "Saturated": {"Value": "", "Percentage": ""},
-                "Trans": {"Value": "", "Percentage": ""},
-            },
-            "Carbohydrate": {
-                "Total": {"Value": "", "Percentage": ""},
-                "Fibre": {"Value": "", "Percentage": ""},
-                "Sugars": {"Value": "", "Percentage": ""},
-            },
-            "Protein": "",
-            "Vitamin A": {"Value": "", "Percentage": ""},
-            "Vitamin C": {"Value": "", "Percentage": ""},
-            "Cholesterol": "",
-            "Sodium": {"Value": "", "Percentage": ""},
-            "Potassium": {"Value": "", "Percentage": ""},
-            "Calcium": {"Value": "", "Percentage": ""},
-            "Iron": {"Value": "", "Percentage": ""},
-        }
-
-        nutrition_facts_div = soup.find(
-            "section", class_="product_detail_copy product-description-template-target"
-        )
-        if not nutrition_facts_div:
-            return nutrition_facts
-
-        serving_size = nutrition_facts_div.find(
-            lambda tag: tag.name == "p" and "Serving Size" in tag.text
-        )
-        if serving_size:
-            nutrition_facts["Serving Size"] = (
-                serving_size.text.splitlines()[0].replace("Serving Size", "").strip()
-            )
-            nutrition_facts["Portion"] = (
-                serving_size.text.splitlines()[1].replace("Portion", "").strip()
-            )
-
-        rows = nutrition_facts_div.find_all("div", class_="newrow border-bottom")
-
-        print(nutrition_facts_div)
-
-        for row in rows:
-            columns = row.find_all("span")
-            key = columns[0].text.strip()
-            value = columns[1].text.strip()
-            print(key, value)
-
-            if "Calories" in key:
-                nutrition_facts["Calories"] = value
-            elif "Fat" in key and "Saturated" not in key:
-                nutrition_facts["Fat"]["Total"]["Value"] = (
-                    key.split()[-2] + " " + key.split()[-1]
-                )
-                nutrition_facts["Fat"]["Total"]["Percentage"] = value.split()[0]
-            elif "Saturated" in key:
-                nutrition_facts["Fat"]["Saturated"]["Value"] = (
-                    key.split()[-5]
-                    + " "
-                    + key.split()[-4]
-                    + " "
-                    + key.split()[-3]
-                    + " "
-                    + key.split()[-2]
-                    + " "
-                    + key.split()[-1]
-                )
-                nutrition_facts["Fat"]["Saturated"]["Percentage"] = value.split()[0]
-                nutrition_facts["Fat"]["Trans"]["Value"] = (
-                    key.split()[-3] + " " + key.split()[-2] + " " + key.split()[-1]
-                )
-                nutrition_facts["Fat"]["Trans"]["Percentage"] = value.split()[0]
-            elif "Cholesterol" in key:
-                nutrition_facts["Cholesterol"] = value
-            elif "Sodium" in key:
-                nutrition_facts["Sodium"]["Value"] = value
-                nutrition_facts["Sodium"]["Percentage"] = value.split()[0]
-            elif "Carbohydrate" in key:
-                nutrition_facts["Carbohydrate"]["Total"]["Value"] = (
-                    key.split()[-2] + " " + key.split()[-1]
-                )
-                nutrition_facts["Carbohydrate"]["Total"]["Percentage"] = value.split()[
-                    0
-                ]
-            elif "Fibre" in key:
-                nutrition_facts["Carbohydrate"]["Fibre"]["Value"] = (
-                    key.split()[-2] + " " + key.split()[-1]
-                )
-                nutrition_facts["Carbohydrate"]["Fibre"]["Percentage"] = value.split()[
-                    0
-                ]
-            elif "Sugars" in key:
-                nutrition_facts["Carbohydrate"]["Sugars"]["Value"] = (
-                    key.split()[-2] + " " + key.split()[-1]
-                )
-                nutrition_facts["Carbohydrate"]["Sugars"]["Percentage"] = key.split()[
-                    -2
-                ]
-            elif "Protein" in key:
-                nutrition_facts["Protein"] = key.split()[-2] + " " + key.split()[-1]
-            elif "Vitamin A" in key:
-                nutrition_facts["Vitamin A"]["Value"] = (
-                    key.split()[-2] + " " + key.split()[-1]
-                )
-                nutrition_facts["Vitamin A"]["Percentage"] = value.split()[0]
-            elif "Vitamin C" in key:
-                nutrition_facts["Vitamin C"]["Value"] = (
-                    key.split()[-2] + " " + key.split()[-1]
-                )
-                nutrition_facts["Vitamin C"]["Percentage"] = value.split()[0]
-            elif "Cholesterol" in key:
-                nutrition_facts["Cholesterol"] = key
-            elif "Sodium" in key:
-                print(key)
-                print(value)
-                nutrition_facts["Sodium"]["Value"] = key
-                nutrition_facts["Sodium"]["Percentage"] = value.split()[0]
-            elif "Potassium" in key:
-                nutrition_facts["Potassium"]["Value"] = key
-                nutrition_facts["Potassium"]["Percentage"] = value.split()[0]
-            elif "Calcium" in key:
-                nutrition_facts["Calcium"]["Value"] = key
-                nutrition_facts["Calcium"]["Percentage"] = value.split()[0]
-            elif "Iron" in key:
-                nutrition_facts["Iron"]["Value"] = key
-                nutrition_facts["Iron"]["Percentage"] = value.split()[0]
-
-        console = Console()
-        console.print(nutrition_facts)
-
-        return {
-            "name": product_name,
-            "bbPLU": product_bbplu,
-            "price": product_price,
-            "image": image_url,
-            "details": details,
-            "nutrition_facts": nutrition_facts,
-        }
-
     def display_product_details(self, url: str):
         console = Console()
         table = Table(show_header=True, header_style="bold magenta")
@@ -559,6 +375,44 @@ class BulkBarn:
         self.set_local_storage(page, {"storeCode": store_id})
         self.set_local_storage(page, {"userProvince": province})
 
+    def load_store(self, page, store_id: int, province: str) -> None:
+        """Select a store and load its ecomm catalogue into local storage."""
+        page.goto(BULKBARN_STORES_URL)
+        self.set_store(page, store_id, province)
+        page.goto(BULKBARN_ECOMM_URL)
+        page.wait_for_load_state("networkidle")
+
+    def get_store_items(self, page) -> List[Dict[str, str]]:
+        """
+        Get the ecomm item records of the store loaded in the page.
+
+        :param page: Playwright Page object, after load_store
+        :return: List of item records, see generate_item
+        """
+        function = (
+            "() => Object.keys(window.localStorage)"
+            ".filter((key) => /^item\\d+$/.test(key))"
+            ".map((key) => window.localStorage.getItem(key))"
+        )
+        return [
+            self.generate_item(json.loads(item)) for item in page.evaluate(function)
+        ]
+
+    def get_price_matrix(
+        self,
+        stores: List[Dict[str, Union[str, int]]] = None,
+        workers: int = 4,
+        price_field: str = "Retail_Price",
+        headless: bool = True,
+    ) -> pd.DataFrame:
+        """Get the store x BBPLU price matrix, see matrix.PriceMatrix."""
+        if stores is None:
+            stores = self.get_store_locations()
+        self.price_matrix = PriceMatrix(
+            type(self), workers=workers, price_field=price_field, headless=headless
+        ).collect(stores)
+        return self.price_matrix.to_dataframe()
+
     def setup_cart(
         self,
         store_id: int = "741",
@@ -0,0 +1,439 @@
+import json
+import os
+import socket
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict
+from typing import List
+from typing import Union
+
+from utils import *
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class CrawlQueue:
+    """
+    Durable work queue of URLs to crawl, kept in a SQLite file.
+
+    Every task is one row with its status and, once done, its parsed result,
+    so the queue doubles as the checkpoint of the crawl. Each crawl is a
+    generation of the queue: resuming keeps working on the latest generation,
+    start_new() begins the next one from the entry points.
+
+    A failed task waits backoff seconds, doubled at every attempt, before it
+    is claimed again, so a short outage does not use up its attempts. A
+    generation is only marked finished when at most max_failures of its
+    tasks failed, readers keep the previous one otherwise.
+
+    Several processes can pull from the same queue. Several machines can too,
+    through a file on a shared mount, but only with the default rollback
+    journal: WAL needs shared memory, so only pass wal=True when every worker
+    runs on the same host.
+    """
+
+    def __init__(
+        self,
+        path: str = "crawl.db",
+        lease: int = 600,
+        max_attempts: int = 3,
+        wal: bool = False,
+        readonly: bool = False,
+        backoff: float = 30.0,
+        max_failures: float = 0.01,
+    ):
+        self.path = path
+        # seconds after which a running task is considered lost by its worker
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        # fraction of the tasks of a generation allowed to fail
+        self.max_failures = max_failures
+        if readonly:
+            # readers never create the file, its tables or a generation
+            self.connection = sqlite3.connect(
+                Path(path).absolute().as_uri() + "?mode=ro",
+                timeout=60,
+                isolation_level=None,
+                uri=True,
+            )
+            self.generation = self.latest_generation()
+            return
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        if wal:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS generations (
+                generation INTEGER PRIMARY KEY,
+                started_at REAL NOT NULL,
+                finished_at REAL
+            )
+            """)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                generation INTEGER NOT NULL,
+                url TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                claimed_at REAL,
+                not_before REAL,
+                result TEXT,
+                error TEXT,
+                PRIMARY KEY (generation, url)
+            )
+            """)
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS tasks_status"
+            " ON tasks (generation, status, kind)"
+        )
+        self.generation = self.latest_generation() or self.start_new(prune=False)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def latest_generation(self) -> Union[int, None]:
+        return self.connection.execute(
+            "SELECT MAX(generation) FROM generations"
+        ).fetchone()[0]
+
+    def finished_generation(self) -> Union[int, None]:
+        """Get the latest generation whose crawl went through the whole queue."""
+        return self.connection.execute(
+            "SELECT MAX(generation) FROM generations WHERE finished_at IS NOT NULL"
+        ).fetchone()[0]
+
+    def start_new(self, prune: bool = True) -> int:
+        """
+        Begin a new crawl generation, its queue starts empty.
+
+        :param prune: Drop the generations before the previous one, the
+            previous one is kept for readers until the new crawl finishes
+        :return: The new generation
+        """
+        cursor = self.connection.execute(
+            "INSERT INTO generations (started_at) VALUES (?)", (time.time(),)
+        )
+        self.generation = cursor.lastrowid
+        if prune:
+            self.connection.execute(
+                "DELETE FROM tasks WHERE generation < ?", (self.generation - 1,)
+            )
+            self.connection.execute(
+                "DELETE FROM generations WHERE generation < ?", (self.generation - 1,)
+            )
+        return self.generation
+
+    def finish(self) -> bool:
+        """
+        Mark the generation finished once no task is pending or running.
+
+        :return: False if tasks are left, or more than max_failures failed
+        """
+        counts = self.counts()
+        if counts.get(FAILED, 0) > self.max_failures * sum(counts.values()):
+            return False
+        cursor = self.connection.execute(
+            """
+            UPDATE generations SET finished_at = ?
+            WHERE generation = ? AND finished_at IS NULL AND NOT EXISTS (
+                SELECT 1 FROM tasks
+                WHERE generation = ? AND status IN (?, ?)
+            )
+            """,
+            (time.time(), self.generation, self.generation, PENDING, RUNNING),
+        )
+        return cursor.rowcount == 1
+
+    def put(self, url: str, kind: str) -> bool:
+        """Add a task, return False if the url is already queued."""
+        cursor = self.connection.execute(
+            """
+            INSERT OR IGNORE INTO tasks (generation, url, kind, status)
+            VALUES (?, ?, ?, ?)
+            """,
+            (self.generation, url, kind, PENDING),
+        )
+        return cursor.rowcount == 1
+
+    def recover(self, host: str) -> int:
+        """Release the running tasks of this host's workers that have died."""
+        rows = self.connection.execute(
+            "SELECT url, worker FROM tasks"
+            " WHERE generation = ? AND status = ? AND worker LIKE ?",
+            (self.generation, RUNNING, f"{host}:%"),
+        ).fetchall()
+        stale = [
+            url for url, worker in rows if not pid_alive(int(worker.split(":")[-1]))
+        ]
+        for url in stale:
+            # an expired lease makes the task claimable right away
+            self.connection.execute(
+                "UPDATE tasks SET claimed_at = 0"
+                " WHERE generation = ? AND url = ? AND status = ?",
+                (self.generation, url, RUNNING),
+            )
+        return len(stale)
+
+    def claim(self, worker: str) -> Union[Dict[str, str], None]:
+        """Take the next pending task, or a task whose lease has expired."""
+        now = time.time()
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            # a task whose worker died max_attempts times will not be retried
+            self.connection.execute(
+                """
+                UPDATE tasks
+                SET status = ?, error = COALESCE(error, 'worker lost the task')
+                WHERE generation = ? AND status = ? AND claimed_at < ?
+                    AND attempts >= ?
+                """,
+                (FAILED, self.generation, RUNNING, now - self.lease, self.max_attempts),
+            )
+            row = self.connection.execute(
+                """
+                SELECT url, kind FROM tasks
+                WHERE generation = ? AND (
+                    (status = ? AND (not_before IS NULL OR not_before <= ?))
+                    OR (status = ? AND claimed_at < ?)
+                )
+                ORDER BY rowid LIMIT 1
+                """,
+                (self.generation, PENDING, now, RUNNING, now - self.lease),
+            ).fetchone()
+            if row is not None:
+                self.connection.execute(
+                    """
+                    UPDATE tasks
+                    SET status = ?, worker = ?, claimed_at = ?, attempts = attempts + 1
+                    WHERE generation = ? AND url = ?
+                    """,
+                    (RUNNING, worker, now, self.generation, row[0]),
+                )
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return {"url": row[0], "kind": row[1]}
+
+    def complete(self, url: str, result) -> None:
+        """Mark a task done and checkpoint its result."""
+        self.connection.execute(
+            "UPDATE tasks SET status = ?, result = ?, error = NULL"
+            " WHERE generation = ? AND url = ?",
+            (DONE, json.dumps(result), self.generation, url),
+        )
+
+    def fail(self, url: str, error: str) -> None:
+        """
+        Put a task back in the queue after a delay, or mark it failed after
+        max_attempts.
+        """
+        self.connection.execute(
+            """
+            UPDATE tasks
+            SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, error = ?,
+                not_before = ? + ? * (1 << (attempts - 1))
+            WHERE generation = ? AND url = ?
+            """,
+            (
+                self.max_attempts,
+                FAILED,
+                PENDING,
+                error,
+                time.time(),
+                self.backoff,
+                self.generation,
+                url,
+            ),
+        )
+
+    def retry_failed(self) -> int:
+        """Put the failed tasks back in the queue."""
+        cursor = self.connection.execute(
+            "UPDATE tasks SET status = ?, attempts = 0, not_before = NULL"
+            " WHERE generation = ? AND status = ?",
+            (PENDING, self.generation, FAILED),
+        )
+        return cursor.rowcount
+
+    def results(self, kind: str, generation: int = None) -> List:
+        """Get the checkpointed results of the done tasks of a kind."""
+        rows = self.connection.execute(
+            "SELECT result FROM tasks"
+            " WHERE generation = ? AND kind = ? AND status = ? ORDER BY rowid",
+            (generation or self.generation, kind, DONE),
+        )
+        return [json.loads(row[0]) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        """Get the number of tasks per status."""
+        rows = self.connection.execute(
+            "SELECT status, COUNT(*) FROM tasks WHERE generation = ? GROUP BY status",
+            (self.generation,),
+        )
+        return dict(rows.fetchall())
+
+
+class Crawler:
+    """Resumable crawl of the catalogue, products, recipes and stores."""
+
+    def __init__(
+        self,
+        bulkbarn,
+        path: str = "crawl.db",
+        details: bool = True,
+        max_attempts: int = 3,
+        wal: bool = False,
+        backoff: float = 30.0,
+    ):
+        self.bulkbarn = bulkbarn
+        self.queue = CrawlQueue(
+            path, max_attempts=max_attempts, wal=wal, backoff=backoff
+        )
+        self.details = details
+        self.host = socket.gethostname()
+        self.worker = f"{self.host}:{os.getpid()}"
+
+    def seed(self) -> None:
+        """Queue the entry points of the crawl, a no-op when resuming."""
+        self.queue.put(BULKBARN_PRODUCTS_URL, "categories")
+        self.queue.put(BULKBARN_RECIPES_URL, "recipes")
+        self.queue.put(BULKBARN_STORES_URL, "stores")
+
+    def start_new(self) -> int:
+        """Begin a new crawl generation from the entry points."""
+        generation = self.queue.start_new()
+        self.seed()
+        return generation
+
+    def handle(self, task: Dict[str, str]):
+        """Fetch and parse a task, queueing the urls it links to."""
+        url, kind = task["url"], task["kind"]
+        if kind == "categories":
+            categories = self.bulkbarn.get_categories()
+            for category in categories:
+                self.queue.put(category["url"], "category")
+            return categories
+        if kind == "category":
+            products = self.bulkbarn.get_category_products(url)
+            if self.details:
+                for product in products:
+                    self.queue.put(product["url"], "product")
+            return products
+        if kind == "product":
+            return self.bulkbarn.get_products_details(url)
+        if kind == "recipes":
+            return self.bulkbarn.get_recipes_categories()
+        if kind == "stores":
+            return self.bulkbarn.get_store_locations()
+        raise ValueError(f"Unknown task kind: {kind}")
+
+    def run(self, limit: int = None, poll: float = 1.0) -> int:
+        """Work through the queue until it is empty, return the tasks done."""
+        done = 0
+        self.queue.recover(self.host)
+        while limit is None or done < limit:
+            task = self.queue.claim(self.worker)
+            if task is None:
+                # other workers may still queue the urls of the pages they
+                # parse, and failed tasks wait for their retry
+                counts = self.queue.counts()
+                if counts.get(RUNNING) or counts.get(PENDING):
+                    time.sleep(poll)
+                    self.queue.recover(self.host)
+                    continue
+                self.queue.finish()
+                break
+            try:
+                result = self.handle(task)
+            except Exception as e:
+                self.queue.fail(task["url"], repr(e))
+                continue
+            self.queue.complete(task["url"], result)
+            done += 1
+        return done
+
+    def load(self) -> None:
+        """Load the checkpointed results back into the BulkBarn instance."""
+        self.bulkbarn.categories = [
+            category
+            for categories in self.queue.results("categories")
+            for category in categories
+        ]
+        self.bulkbarn.products = [
+            product
+            for products in self.queue.results("category")
+            for product in products
+        ]
+        self.bulkbarn.products_details = self.queue.results("product")
+        self.bulkbarn.store_locations = [
+            store for stores in self.queue.results("stores") for store in stores
+        ]
+
+
+def run_worker(
+    bulkbarn_cls, path: str, details: bool, wal: bool, limit: int = None
+) -> int:
+    """Run a crawl worker in its own process on the shared queue."""
+    crawler = Crawler(bulkbarn_cls(), path, details, wal=wal)
+    try:
+        return crawler.run(limit)
+    finally:
+        crawler.queue.close()
+
+
+def run_workers(
+    bulkbarn_cls,
+    path: str = "crawl.db",
+    workers: int = 4,
+    details: bool = True,
+    *,
+    resume: bool = None,
+    wal: bool = False,
+) -> int:
+    """
+    Drain the queue with a pool of worker processes.
+
+    :param resume: Continue the latest crawl where it stopped, retrying its
+        failed tasks, or start a new crawl generation from the entry points.
+        By default the latest crawl is resumed unless it finished
+    :return: Number of tasks done
+    """
+    crawler = Crawler(bulkbarn_cls(), path, details, wal=wal)
+    queue = crawler.queue
+    if resume is None:
+        resume = queue.finished_generation() != queue.latest_generation()
+    if resume:
+        queue.retry_failed()
+        crawler.seed()
+    else:
+        crawler.start_new()
+    # the entry points fan out the queue before the pool starts pulling from it
+    done = crawler.run(limit=1)
+    crawler.queue.close()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(run_worker, bulkbarn_cls, path, details, wal)
+            for _ in range(workers)
+        ]
+        return done + sum(future.result() for future in futures)
@@ -0,0 +1,396 @@
+from typing import Dict
+from typing import List
+from typing import Tuple
+from typing import TypedDict
+from typing import Union
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+from bs4 import SoupStrainer
+from bs4 import Tag
+from utils import *
+
+
+class ExtractionError(ValueError):
+    """The page is not a product detail page."""
+
+
+class ValuePercentage(TypedDict):
+    Value: str
+    Percentage: str
+
+
+FatFacts = TypedDict(
+    "FatFacts",
+    {"Total": ValuePercentage, "Saturated": ValuePercentage, "Trans": ValuePercentage},
+)
+CarbohydrateFacts = TypedDict(
+    "CarbohydrateFacts",
+    {"Total": ValuePercentage, "Fibre": ValuePercentage, "Sugars": ValuePercentage},
+)
+NutritionFacts = TypedDict(
+    "NutritionFacts",
+    {
+        "Serving Size": str,
+        "Portion": str,
+        "Calories": str,
+        "Fat": FatFacts,
+        "Carbohydrate": CarbohydrateFacts,
+        "Protein": str,
+        "Vitamin A": ValuePercentage,
+        "Vitamin C": ValuePercentage,
+        "Cholesterol": str,
+        "Sodium": ValuePercentage,
+        "Potassium": ValuePercentage,
+        "Calcium": ValuePercentage,
+        "Iron": ValuePercentage,
+    },
+)
+DietaryInformation = TypedDict(
+    "DietaryInformation",
+    {
+        "Organic": str,
+        "Peanut Free": str,
+        "Vegan": str,
+        "Gluten-Free": str,
+        "Dairy Free": str,
+        "Non GMO": str,
+    },
+)
+Details = TypedDict(
+    "Details",
+    {
+        "Dietary Information": DietaryInformation,
+        "Ingredients": str,
+        "Allergens": str,
+        "Directions for Use": str,
+        "Usage Tips": str,
+        "Storage Tips": str,
+        "Points of Interest": str,
+        "Other": str,
+    },
+)
+
+
+class ProductDetails(TypedDict):
+    name: str
+    bbPLU: str
+    price: str
+    image: str
+    details: Details
+    nutrition_facts: NutritionFacts
+    # parts of the page that could not be extracted, left empty
+    errors: List[str]
+
+
+# (path in the result, tag, class) of the fields of the product card
+DETAIL_FIELDS = [
+    (("name",), "p", "prod-name"),
+    (("bbPLU",), "p", "prod-desc"),
+    (("price",), "p", "prod-price"),
+    (("details", "Dietary Information", "Organic"), "li", "list-ind-organic"),
+    (("details", "Dietary Information", "Peanut Free"), "li", "list-ind-peanutfree"),
+    (("details", "Dietary Information", "Vegan"), "li", "list-ind-vegan"),
+    (("details", "Dietary Information", "Gluten-Free"), "li", "list-ind-glutenfree"),
+    (("details", "Dietary Information", "Dairy Free"), "li", "list-ind-dairyfree"),
+    (("details", "Dietary Information", "Non GMO"), "li", "list-ind-nongmo"),
+    (("details", "Ingredients"), "p", "prod-ing"),
+    (("details", "Allergens"), "p", "prod-algn"),
+    (("details", "Directions for Use"), "p", "prod-dir"),
+    (("details", "Usage Tips"), "p", "prod-use"),
+    (("details", "Storage Tips"), "p", "prod-store"),
+    (("details", "Points of Interest"), "p", "prod-poi"),
+    (("details", "Other"), "p", "prod-other"),
+]
+REQUIRED_FIELDS = {("name",), ("bbPLU",), ("price",)}
+# the product and nutrition facts are both sections, the rest of the page
+# (header, menus, footer) is not even built into the tree
+SECTIONS = SoupStrainer("section")
+
+
+def last_words(count: int):
+    return lambda words, value: " ".join(words[-count:])
+
+
+def first_word(words, value):
+    return value.split()[0] if value else ""
+
+
+def whole_value(words, value):
+    return value
+
+
+def whole_key(words, value):
+    return " ".join(words)
+
+
+def second_last_word(words, value):
+    return words[-2] if len(words) > 1 else ""
+
+
+# (label, excluded label, [(path in the nutrition facts, getter)]) of the
+# nutrition table rows, the first rule whose label is in the row applies
+NUTRITION_RULES = [
+    ("Calories", None, [(("Calories",), whole_value)]),
+    (
+        "Fat",
+        "Saturated",
+        [
+            (("Fat", "Total", "Value"), last_words(2)),
+            (("Fat", "Total", "Percentage"), first_word),
+        ],
+    ),
+    (
+        "Saturated",
+        None,
+        [
+            (("Fat", "Saturated", "Value"), last_words(5)),
+            (("Fat", "Saturated", "Percentage"), first_word),
+            (("Fat", "Trans", "Value"), last_words(3)),
+            (("Fat", "Trans", "Percentage"), first_word),
+        ],
+    ),
+    ("Cholesterol", None, [(("Cholesterol",), whole_value)]),
+    (
+        "Sodium",
+        None,
+        [
+            (("Sodium", "Value"), last_words(2)),
+            (("Sodium", "Percentage"), first_word),
+        ],
+    ),
+    (
+        "Carbohydrate",
+        None,
+        [
+            (("Carbohydrate", "Total", "Value"), last_words(2)),
+            (("Carbohydrate", "Total", "Percentage"), first_word),
+        ],
+    ),
+    (
+        "Fibre",
+        None,
+        [
+            (("Carbohydrate", "Fibre", "Value"), last_words(2)),
+            (("Carbohydrate", "Fibre", "Percentage"), first_word),
+        ],
+    ),
+    (
+        "Sugars",
+        None,
+        [
+            (("Carbohydrate", "Sugars", "Value"), last_words(2)),
+            (("Carbohydrate", "Sugars", "Percentage"), second_last_word),
+        ],
+    ),
+    ("Protein", None, [(("Protein",), last_words(2))]),
+    (
+        "Vitamin A",
+        None,
+        [
+            (("Vitamin A", "Value"), last_words(2)),
+            (("Vitamin A", "Percentage"), first_word),
+        ],
+    ),
+    (
+        "Vitamin C",
+        None,
+        [
+            (("Vitamin C", "Value"), last_words(2)),
+            (("Vitamin C", "Percentage"), first_word),
+        ],
+    ),
+] + [
+    (
+        mineral,
+        None,
+        [((mineral, "Value"), whole_key), ((mineral, "Percentage"), first_word)],
+    )
+    for mineral in ("Potassium", "Calcium", "Iron")
+]
+
+
+def value() -> ValuePercentage:
+    return {"Value": "", "Percentage": ""}
+
+
+def empty_details() -> ProductDetails:
+    return {
+        "name": "",
+        "bbPLU": "",
+        "price": "",
+        "image": "",
+        "details": {
+            "Dietary Information": {
+                "Organic": "",
+                "Peanut Free": "",
+                "Vegan": "",
+                "Gluten-Free": "",
+                "Dairy Free": "",
+                "Non GMO": "",
+            },
+            "Ingredients": "",
+            "Allergens": "",
+            "Directions for Use": "",
+            "Usage Tips": "",
+            "Storage Tips": "",
+            "Points of Interest": "",
+            "Other": "",
+        },
+        "nutrition_facts": {
+            "Serving Size": "",
+            "Portion": "",
+            "Calories": "",
+            "Fat": {"Total": value(), "Saturated": value(), "Trans": value()},
+            "Carbohydrate": {"Total": value(), "Fibre": value(), "Sugars": value()},
+            "Protein": "",
+            "Vitamin A": value(),
+            "Vitamin C": value(),
+            "Cholesterol": "",
+            "Sodium": value(),
+            "Potassium": value(),
+            "Calcium": value(),
+            "Iron": value(),
+        },
+        "errors": [],
+    }
+
+
+def assign(result: Dict, path: Tuple[str, ...], value: str) -> None:
+    for key in path[:-1]:
+        result = result[key]
+    result[path[-1]] = value
+
+
+class DetailExtractor:
+    """
+    Product detail page parser compiled from DETAIL_FIELDS.
+
+    The fields are indexed by (tag, class) so a single walk over the page
+    fills the whole result, instead of one search of the tree per field.
+    """
+
+    def __init__(self, fields=DETAIL_FIELDS, nutrition_rules=NUTRITION_RULES):
+        self.plan = {}
+        for path, name, class_ in fields:
+            self.plan.setdefault((name, class_), path)
+        self.nutrition_rules = nutrition_rules
+
+    def extract(self, html: Union[str, BeautifulSoup]) -> ProductDetails:
+        soup = (
+            html
+            if isinstance(html, BeautifulSoup)
+            else BeautifulSoup(html, "html.parser", parse_only=SECTIONS)
+        )
+        result = empty_details()
+        found = set()
+        image = None
+        content = False
+        cards = 0
+        serving_size = None
+        rows = []
+
+        # (tag, scope, in products-content), scope is None, "content", "card",
+        # "nutrition" or the spans of a nutrition row
+        stack = [(soup, None, False)]
+        while stack:
+            tag, scope, in_content = stack.pop()
+            classes = tag.get("class") or []
+
+            if tag.name == "section" and tag.get("id") == "products-content":
+                content = in_content = True
+                scope = "content"
+            elif tag.name == "section" and "product_detail_copy" in classes:
+                scope = "nutrition"
+            elif scope == "content" and tag.name == "div":
+                if "greystripe" in classes and "product-detail-card" in classes:
+                    # the product card is the second card of the content
+                    cards += 1
+                    if cards == 2:
+                        scope = "card"
+
+            if scope == "card":
+                for class_ in classes:
+                    path = self.plan.get((tag.name, class_))
+                    if path is not None and path not in found:
+                        found.add(path)
+                        assign(result, path, tag.text.strip())
+            elif scope == "nutrition":
+                if tag.name == "div" and "newrow" in classes:
+                    if "border-bottom" in classes:
+                        # the row is its own scope, collecting its spans
+                        scope = []
+                        rows.append(scope)
+                elif tag.name == "p" and serving_size is None:
+                    text = tag.text
+                    if "Serving Size" in text:
+                        serving_size = text
+            elif isinstance(scope, list) and tag.name == "span":
+                scope.append(tag.text.strip())
+
+            if image is None and in_content and tag.name == "li":
+                if "blowup" in classes and "currentDisplayItem" in classes:
+                    image = tag
+
+            stack.extend(
+                (child, scope, in_content)
+                for child in reversed(tag.contents)
+                if isinstance(child, Tag)
+            )
+
+        if not content:
+            raise ExtractionError("No products-content section in the page")
+        if cards < 2:
+            raise ExtractionError("No product card in the page")
+        missing = REQUIRED_FIELDS - found
+        if missing:
+            raise ExtractionError(
+                "Missing " + ", ".join(path[-1] for path in sorted(missing))
+            )
+
+        # optional fields, like dietary flags, are simply absent from the card
+        errors = result["errors"]
+
+        if image is not None and image.get("data-blowup-content"):
+            result["image"] = urljoin(BULKBARN_URL, image["data-blowup-content"])
+        else:
+            errors.append("image")
+
+        nutrition_facts = result["nutrition_facts"]
+        if serving_size is not None:
+            lines = serving_size.splitlines()
+            nutrition_facts["Serving Size"] = (
+                lines[0].replace("Serving Size", "").strip()
+            )
+            if len(lines) > 1:
+                nutrition_facts["Portion"] = lines[1].replace("Portion", "").strip()
+        else:
+            errors.append("nutrition_facts / Serving Size")
+
+        if not rows:
+            errors.append("nutrition_facts")
+        for columns in rows:
+            if len(columns) < 2:
+                errors.append(f"nutrition_facts / {' '.join(columns)}")
+                continue
+            self.parse_nutrition_row(nutrition_facts, columns[0], columns[1])
+
+        return result
+
+    def parse_nutrition_row(
+        self, nutrition_facts: NutritionFacts, key: str, value: str
+    ) -> None:
+        words = key.split()
+        for label, excluded, getters in self.nutrition_rules:
+            if label in key and (excluded is None or excluded not in key):
+                for path, getter in getters:
+                    assign(nutrition_facts, path, getter(words, value))
+                return
+
+
+extractor = DetailExtractor()
+
+
+def extract_product_details(html: Union[str, BeautifulSoup]) -> ProductDetails:
+    """Extract the details of a product page, see DetailExtractor."""
+    return extractor.extract(html)
@@ -0,0 +1,265 @@
+import bisect
+import gzip
+import json
+import os
+import re
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Tuple
+
+import pandas as pd
+
+# digits with "," or "." separators, or a space before a group of three digits
+AMOUNT = re.compile(r"\d+(?:(?:[,.]|[ \u00a0](?=\d{3}(?!\d)))\d+)*")
+
+
+def parse_price(text: str) -> float:
+    """
+    Parse the first amount of a price string, in English or French format,
+    e.g. "$1,234.56 / 100g", "$1,234" or "1 234,56 $".
+    """
+    match = AMOUNT.search(text or "")
+    if match is None:
+        raise ValueError(f"No price in {text!r}")
+    amount = re.sub(r"[ \u00a0]", "", match.group())
+    separators = [c for c in amount if c in ",."]
+    if not separators:
+        return float(amount)
+    last = separators[-1]
+    integer, _, fraction = amount.rpartition(last)
+    # a repeated separator, or a single comma before three digits, only
+    # groups thousands
+    if separators.count(last) > 1 or (separators == [","] and len(fraction) == 3):
+        return float(re.sub(r"[,.]", "", amount))
+    return float(re.sub(r"[,.]", "", integer) + "." + fraction)
+
+
+def place(series: List[List], ordinal: int, price: float) -> bool:
+    """
+    Put an observation in its place in a sorted list of runs.
+
+    :return: True if the price differs from the price of the day before
+    """
+    index = bisect.bisect_right([run[0] for run in series], ordinal) - 1
+    if index >= 0 and series[index][1] >= ordinal:
+        start, end, current = series[index]
+        if current == price:
+            return False
+        # the observation splits the run it falls in
+        pieces = [[start, ordinal - 1, current]] if start < ordinal else []
+        pieces.append([ordinal, ordinal, price])
+        if ordinal < end:
+            pieces.append([ordinal + 1, end, current])
+        series[index : index + 1] = pieces
+        index += 1 if start < ordinal else 0
+    else:
+        index += 1
+        series.insert(index, [ordinal, ordinal, price])
+
+    if index + 1 < len(series) and series[index + 1][2] == price:
+        series[index][1] = series[index + 1][1]
+        del series[index + 1]
+    if index > 0 and series[index - 1][2] == price:
+        series[index - 1][1] = series[index][1]
+        del series[index]
+        return False
+    return True
+
+
+def effective_price(item: Dict[str, str], day: date) -> float:
+    """Get the price of an ecomm item record on a day, sale price included."""
+    try:
+        sale_start = datetime.strptime(item["Sale_Start_Date"], "%Y-%m-%d %H:%M")
+        sale_end = datetime.strptime(item["Sale_End_Date"], "%Y-%m-%d %H:%M")
+        if item["Sale_Price"] and sale_start.date() <= day <= sale_end.date():
+            return float(item["Sale_Price"])
+    except (KeyError, ValueError):
+        pass
+    return float(item["Retail_Price"])
+
+
+class PriceHistory:
+    """
+    Price history of every BBPLU, one observation per crawl.
+
+    Prices rarely change, so a series is stored as runs of
+    (first day, last day, price), partitioned by month in gzipped columnar
+    files. Queries only read the partitions overlapping their range.
+    """
+
+    def __init__(self, path: str = "prices"):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.partitions = {}
+
+    @staticmethod
+    def month(day: date) -> str:
+        return day.strftime("%Y-%m")
+
+    @staticmethod
+    def months(start: date, end: date) -> List[str]:
+        """Get the partitions covering the days from start to end."""
+        months = []
+        year, month = start.year, start.month
+        while (year, month) <= (end.year, end.month):
+            months.append(f"{year:04d}-{month:02d}")
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return months
+
+    def partition_path(self, month: str) -> str:
+        return os.path.join(self.path, f"{month}.json.gz")
+
+    def load_partition(self, month: str) -> Dict[str, List[List]]:
+        """Load the runs of a month, keyed by BBPLU."""
+        path = self.partition_path(month)
+        if not os.path.exists(path):
+            return {}
+        mtime = os.path.getmtime(path)
+        if month in self.partitions and self.partitions[month][0] == mtime:
+            return self.partitions[month][1]
+
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            columns = json.load(f)
+        runs = {}
+        for bbplu, start, end, price in zip(
+            columns["bbplu"], columns["start"], columns["end"], columns["price"]
+        ):
+            runs.setdefault(bbplu, []).append([start, end, price])
+
+        self.partitions[month] = (mtime, runs)
+        return runs
+
+    def save_partition(self, month: str, runs: Dict[str, List[List]]) -> None:
+        """Write the runs of a month, replacing the partition atomically."""
+        columns = {"bbplu": [], "start": [], "end": [], "price": []}
+        for bbplu in sorted(runs):
+            for start, end, price in runs[bbplu]:
+                columns["bbplu"].append(bbplu)
+                columns["start"].append(start)
+                columns["end"].append(end)
+                columns["price"].append(price)
+
+        path = self.partition_path(month)
+        with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+            json.dump(columns, f, separators=(",", ":"))
+        os.replace(path + ".tmp", path)
+        self.partitions[month] = (os.path.getmtime(path), runs)
+
+    def record(self, prices: Dict[str, float], day: date = None) -> int:
+        """
+        Add one observation per BBPLU.
+
+        Observations usually come after the last day of a series, but a
+        late or repeated crawl is put in its place among the runs. The first
+        observation of a month is compared with the last price of the month
+        before.
+
+        :param prices: Dictionary of BBPLU to price
+        :param day: Day of the crawl, today by default
+        :return: Number of prices that changed
+        """
+        day = day or date.today()
+        ordinal = day.toordinal()
+        month = self.month(day)
+        runs = self.load_partition(month)
+        previous = self.load_partition(self.month(day.replace(day=1) - timedelta(1)))
+        changed = 0
+
+        for bbplu, price in prices.items():
+            price = round(float(price), 4)
+            series = runs.setdefault(str(bbplu), [])
+            if not place(series, ordinal, price):
+                continue
+            # the first run of the month continues the month before
+            before = previous.get(str(bbplu))
+            if series[0][0] == ordinal and before and before[-1][2] == price:
+                continue
+            changed += 1
+
+        self.save_partition(month, runs)
+        return changed
+
+    def record_items(self, items: Iterable[Dict[str, str]], day: date = None) -> int:
+        """Append the effective prices of ecomm item records."""
+        day = day or date.today()
+        prices = {}
+        for item in items:
+            try:
+                prices[item["BBPLU"]] = effective_price(item, day)
+            except ValueError:
+                # no retail price, like store_prices
+                continue
+        return self.record(prices, day)
+
+    def record_details(self, details: Iterable[Dict], day: date = None) -> int:
+        """Append the prices of get_products_details results."""
+        prices = {}
+        for detail in details:
+            try:
+                prices[detail["bbPLU"]] = parse_price(detail["price"])
+            except ValueError:
+                continue
+        return self.record(prices, day)
+
+    def runs(
+        self, bbplu: str, start: date, end: date
+    ) -> List[Tuple[date, date, float]]:
+        """Get the price runs of a BBPLU overlapping the days from start to end."""
+        first, last = start.toordinal(), end.toordinal()
+        runs = []
+        for month in self.months(start, end):
+            for run_start, run_end, price in self.load_partition(month).get(
+                str(bbplu), []
+            ):
+                if run_end < first or run_start > last:
+                    continue
+                runs.append(
+                    (
+                        date.fromordinal(max(run_start, first)),
+                        date.fromordinal(min(run_end, last)),
+                        price,
+                    )
+                )
+        return runs
+
+    def series(self, bbplu: str, days: int = 90, end: date = None) -> pd.Series:
+        """Get the daily price of a BBPLU over the last days."""
+        end = end or date.today()
+        start = end - timedelta(days=days - 1)
+        prices = {}
+        for run_start, run_end, price in self.runs(bbplu, start, end):
+            for ordinal in range(run_start.toordinal(), run_end.toordinal() + 1):
+                prices[date.fromordinal(ordinal)] = price
+        return pd.Series(prices, name=str(bbplu), dtype=float).sort_index()
+
+    def changes(self, start: date, end: date) -> pd.DataFrame:
+        """Get the first and last price of every BBPLU from start to end."""
+        first, last = start.toordinal(), end.toordinal()
+        prices = {}
+        for month in self.months(start, end):
+            for bbplu, runs in self.load_partition(month).items():
+                for run_start, run_end, price in runs:
+                    if run_end < first or run_start > last:
+                        continue
+                    before, _ = prices.get(bbplu, (price, price))
+                    prices[bbplu] = (before, price)
+
+        changes = pd.DataFrame.from_dict(
+            prices, orient="index", columns=["before", "after"], dtype=float
+        )
+        changes.index.name = "bbPLU"
+        changes["change"] = changes["after"] - changes["before"]
+        changes["percentage"] = changes["change"] / changes["before"] * 100
+        return changes
+
+    def biggest_drops(
+        self, days: int = 7, end: date = None, limit: int = 10
+    ) -> pd.DataFrame:
+        """Get the BBPLUs whose price dropped the most over the last days."""
+        end = end or date.today()
+        changes = self.changes(end - timedelta(days=days - 1), end)
+        return changes[changes["change"] < 0].nsmallest(limit, "percentage")
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import mimetypes
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Tuple
+from typing import Union
+
+import httpx
+
+
+def make_thumbnail(source: str, destination: str, size: Tuple[int, int]) -> str:
+    """Write a resized copy of an image, run in a worker process."""
+    try:
+        from PIL import Image
+    except ImportError as e:
+        raise ImportError("Thumbnails require Pillow: pip install pillow") from e
+
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    with Image.open(source) as image:
+        # blobs have no extension, keep the format of the source image
+        image_format = image.format
+        image.thumbnail(size)
+        image.save(destination, format=image_format)
+    return destination
+
+
+class ImageCache:
+    """
+    Content-addressed mirror of the product images.
+
+    Images are stored once under the sha256 of their bytes, whatever the
+    number of products or runs pointing at them or the extension of their
+    url. An index keeps the content type, ETag and Last-Modified of every url
+    so unchanged images are skipped with conditional requests.
+    """
+
+    def __init__(
+        self, client: httpx.Client, path: str = "images", workers: int = 8
+    ) -> None:
+        self.client = client
+        self.path = path
+        self.workers = workers
+        self.index_path = os.path.join(path, "index.json")
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding="utf-8") as f:
+                self.index = json.load(f)
+        else:
+            self.index = {}
+
+    def save_index(self) -> None:
+        with open(self.index_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.path, digest[:2], digest)
+
+    def store(self, content: bytes) -> str:
+        """Write the content under its digest, unless already stored."""
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                f.write(content)
+            os.replace(path + ".tmp", path)
+        return path
+
+    def fetch(self, url: str) -> Dict[str, Union[str, bool]]:
+        """Download an image unless the server reports it unchanged."""
+        entry = self.index.get(url)
+        headers = {}
+        if entry is not None and os.path.exists(entry["path"]):
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = self.client.get(url, headers=headers)
+        if response.status_code == 304:
+            if not headers:
+                # nothing on disk to be unchanged from
+                raise httpx.HTTPStatusError(
+                    f"Not Modified without validators for {url}",
+                    request=response.request,
+                    response=response,
+                )
+            return {**entry, "changed": False}
+        response.raise_for_status()
+
+        content_type = response.headers.get("content-type", "").split(";")[0]
+        if not content_type.startswith("image/"):
+            content_type = mimetypes.guess_type(httpx.URL(url).path)[0] or content_type
+        entry = {
+            "path": self.store(response.content),
+            "content_type": content_type,
+            "etag": response.headers.get("etag", ""),
+            "last_modified": response.headers.get("last-modified", ""),
+        }
+        return {**entry, "changed": True}
+
+    def download(self, urls: Iterable[str]) -> Dict[str, str]:
+        """
+        Download images concurrently on the shared client.
+
+        :param urls: Image urls, duplicates and empty urls are skipped
+        :return: Dictionary of url to the path of its image on disk
+        """
+        urls = list(dict.fromkeys(url for url in urls if url))
+        paths = {}
+        # urls whose image was downloaded rather than reported unchanged
+        self.changed = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for url, entry in zip(urls, executor.map(self.try_fetch, urls)):
+                    if entry is None:
+                        continue
+                    if entry.pop("changed"):
+                        self.changed.append(url)
+                    paths[url] = entry["path"]
+                    self.index[url] = entry
+        finally:
+            # keep the validators of what was fetched even if the run aborts
+            self.save_index()
+        return paths
+
+    def try_fetch(self, url: str) -> Union[Dict[str, Union[str, bool]], None]:
+        try:
+            return self.fetch(url)
+        except httpx.HTTPError:
+            return None
+
+    def thumbnails(
+        self,
+        paths: Iterable[str],
+        size: Tuple[int, int] = (256, 256),
+        workers: int = None,
+    ) -> List[str]:
+        """Resize images in a process pool, skipping existing thumbnails."""
+        folder = os.path.join(self.path, f"thumbnails-{size[0]}x{size[1]}")
+        paths = list(dict.fromkeys(paths))
+        jobs = []
+        for source in paths:
+            destination = os.path.join(folder, os.path.basename(source))
+            if not os.path.exists(destination):
+                jobs.append((source, destination))
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(make_thumbnail, source, destination, size)
+                for source, destination in jobs
+            ]
+            for future in futures:
+                future.result()
+        return [os.path.join(folder, os.path.basename(source)) for source in paths]
@@ -0,0 +1,158 @@
+import hashlib
+import json
+from concurrent.futures import as_completed
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict
+from typing import List
+from typing import Tuple
+from typing import Union
+
+import pandas as pd
+from playwright.sync_api import sync_playwright
+from utils import province_from_address
+
+
+def store_prices(
+    items: List[Dict[str, str]], province: str, price_field: str = "Retail_Price"
+) -> Dict[str, float]:
+    """Map BBPLU to price for the items sold in a store of the province."""
+    prices = {}
+    for item in items:
+        if province == "QC" and item["not_in_quebec"] == "1":
+            continue
+        try:
+            prices[item["BBPLU"]] = float(item[price_field])
+        except ValueError:
+            continue
+    return prices
+
+
+def collect_shard(
+    bulkbarn_cls, shard: List[Tuple[int, str]], price_field: str, headless: bool
+) -> Tuple[List[Tuple[int, str, Dict[str, float]]], Dict[int, str]]:
+    """
+    Collect the prices of a shard of stores in a single browser.
+
+    :return: Prices of the stores collected, and the error of each store that failed
+    """
+    bulkbarn = bulkbarn_cls()
+    results = []
+    failed = {}
+
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=headless)
+        try:
+            for store_id, province in shard:
+                # a fresh context per store so local storage never leaks between stores
+                context = browser.new_context()
+                try:
+                    page = context.new_page()
+                    bulkbarn.load_store(page, store_id, province)
+                    items = bulkbarn.get_store_items(page)
+                    results.append(
+                        (store_id, province, store_prices(items, province, price_field))
+                    )
+                except Exception as e:
+                    failed[store_id] = repr(e)
+                finally:
+                    context.close()
+        finally:
+            browser.close()
+
+    return results, failed
+
+
+class PriceMatrix:
+    """Store x BBPLU price matrix, collected across a pool of browser workers."""
+
+    def __init__(
+        self,
+        bulkbarn_cls,
+        workers: int = 4,
+        price_field: str = "Retail_Price",
+        headless: bool = True,
+    ):
+        self.bulkbarn_cls = bulkbarn_cls
+        self.workers = workers
+        self.price_field = price_field
+        self.headless = headless
+        # identical price lists are kept once and shared by their stores
+        self.price_lists = {}
+        self.stores = {}
+        self.provinces = {}
+        # store id to the reason its prices could not be collected
+        self.failed = {}
+
+    def shard(
+        self, stores: List[Dict[str, Union[str, int]]]
+    ) -> List[List[Tuple[int, str]]]:
+        """
+        Split the stores round-robin across the workers.
+
+        Stores whose province is neither given nor found in their address are
+        left out and recorded in failed, since the province decides which
+        items they sell.
+        """
+        shards = [[] for _ in range(max(1, min(self.workers, len(stores))))]
+        index = 0
+        for store in stores:
+            store_id = int(store["store_id"])
+            province = store.get("province") or province_from_address(
+                store.get("address", "")
+            )
+            if province is None:
+                self.failed[store_id] = "province not found in the store address"
+                continue
+            shards[index % len(shards)].append((store_id, province))
+            index += 1
+        return shards
+
+    def add(self, store_id: int, province: str, prices: Dict[str, float]) -> str:
+        """Add the price list of a store, return the id of its price list."""
+        digest = hashlib.sha1(
+            json.dumps(prices, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        self.price_lists.setdefault(digest, prices)
+        self.stores[store_id] = digest
+        self.provinces[store_id] = province
+        return digest
+
+    def collect(self, stores: List[Dict[str, Union[str, int]]]) -> "PriceMatrix":
+        """
+        Collect the price list of every store, one browser per worker.
+
+        A store that fails does not stop the others, the matrix keeps the
+        stores collected and failed maps the others to their error.
+        """
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(
+                    collect_shard,
+                    self.bulkbarn_cls,
+                    shard,
+                    self.price_field,
+                    self.headless,
+                ): shard
+                for shard in self.shard(stores)
+                if shard
+            }
+            for future in as_completed(futures):
+                try:
+                    results, failed = future.result()
+                except Exception as e:
+                    # the browser of the whole shard failed
+                    for store_id, _ in futures[future]:
+                        self.failed[store_id] = repr(e)
+                    continue
+                for store_id, province, prices in results:
+                    self.add(store_id, province, prices)
+                self.failed.update(failed)
+        return self
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Store x BBPLU price matrix, NaN where a store does not sell the item."""
+        store_ids = sorted(self.stores)
+        unique = pd.DataFrame.from_dict(self.price_lists, orient="index")
+        matrix = unique.reindex([self.stores[store_id] for store_id in store_ids])
+        matrix.index = pd.Index(store_ids, name="store_id")
+        return matrix.reindex(sorted(matrix.columns, key=str), axis=1)
@@ -0,0 +1,256 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Tuple
+from urllib.parse import parse_qs
+from urllib.parse import unquote
+from urllib.parse import urlsplit
+
+from crawl import CrawlQueue
+
+REASONS = {
+    200: "OK",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+}
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Check an If-None-Match header, a list of ETags or *."""
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in tags or "W/" + etag in tags
+
+
+def encode(data) -> Tuple[bytes, str]:
+    """Serialize a response body once, with its ETag."""
+    body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    return body, '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+class Snapshot:
+    """Immutable catalogue with its JSON responses computed up front."""
+
+    def __init__(
+        self,
+        products: List[Dict],
+        details: List[Dict],
+        categories: List[Dict],
+        stores: List[Dict],
+    ):
+        self.created_at = time.time()
+        self.products = products
+        self.details = {detail["bbPLU"]: detail for detail in details}
+        self.names = [
+            (product["name"].lower(), product["bbPLU"].lower(), product)
+            for product in products
+        ]
+
+        self.responses = {
+            "/products": encode(products),
+            "/categories": encode(categories),
+            "/stores": encode(stores),
+        }
+        for product in products:
+            self.responses["/products/" + product["bbPLU"]] = encode(product)
+        for bbplu, detail in self.details.items():
+            self.responses["/details/" + bbplu] = encode(detail)
+
+    @classmethod
+    def from_bulkbarn(cls, bulkbarn) -> "Snapshot":
+        return cls(
+            bulkbarn.products or [],
+            getattr(bulkbarn, "products_details", None) or [],
+            bulkbarn.categories or [],
+            getattr(bulkbarn, "store_locations", None) or [],
+        )
+
+    @classmethod
+    def from_crawl(cls, path: str = "crawl.db") -> "Snapshot":
+        """
+        Build a snapshot from the latest finished crawl.
+
+        The queue is opened read-only, and a crawl still in progress is never
+        served half-way: its previous generation is used until it finishes.
+        """
+        queue = CrawlQueue(path, readonly=True)
+        try:
+            generation = queue.finished_generation()
+            if generation is None:
+                raise ValueError(f"No finished crawl in {path}")
+
+            def flatten(kind):
+                return [
+                    item for items in queue.results(kind, generation) for item in items
+                ]
+
+            return cls(
+                flatten("category"),
+                queue.results("product", generation),
+                flatten("categories"),
+                flatten("stores"),
+            )
+        finally:
+            queue.close()
+
+    def search(self, query: str, limit: int = 50) -> List[Dict]:
+        query = query.lower()
+        return [
+            product
+            for name, bbplu, product in self.names
+            if query in name or query == bbplu
+        ][:limit]
+
+
+class CatalogueServer:
+    """
+    Read-only HTTP API over a preloaded catalogue.
+
+    Responses come from the current snapshot, searches from an LRU of hot
+    queries. A background task builds a new snapshot with the loader and
+    swaps it in, readers keep the one they started with.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[], Snapshot],
+        host: str = "127.0.0.1",
+        port: int = 8000,
+        refresh: int = 3600,
+        cache_size: int = 1024,
+    ):
+        self.loader = loader
+        self.host = host
+        self.port = port
+        self.refresh = refresh
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.snapshot = None
+
+    def search(self, snapshot: Snapshot, query: str) -> Tuple[bytes, str]:
+        # keyed on the snapshot so a refresh never serves stale results
+        key = (id(snapshot), query.lower())
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        response = self.cache[key] = encode(snapshot.search(query))
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return response
+
+    def respond(
+        self, method: str, target: str, headers: Dict[str, str]
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        """Answer a request from the current snapshot."""
+        if method not in ("GET", "HEAD"):
+            return 405, {"Allow": "GET, HEAD"}, b""
+
+        snapshot = self.snapshot
+        url = urlsplit(target)
+        path = unquote(url.path).rstrip("/") or "/"
+        if path == "/search":
+            query = parse_qs(url.query).get("q", [""])[0]
+            if not query:
+                return 400, {}, b""
+            body, etag = self.search(snapshot, query)
+        elif path in snapshot.responses:
+            body, etag = snapshot.responses[path]
+        else:
+            return 404, {}, b""
+
+        response_headers = {
+            "Content-Type": "application/json",
+            "ETag": etag,
+            "Cache-Control": "no-cache",
+        }
+        if etag_matches(headers.get("if-none-match", ""), etag):
+            return 304, response_headers, b""
+        return 200, response_headers, body
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while line := (await reader.readline()).strip():
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                # the body is not used, but must not be read as the next request
+                if "transfer-encoding" in headers:
+                    headers["connection"] = "close"
+                elif headers.get("content-length", "0").isdigit():
+                    await reader.readexactly(int(headers.get("content-length", "0")))
+                else:
+                    headers["connection"] = "close"
+
+                try:
+                    method, target, version = (
+                        request_line.decode("latin-1").strip().split()
+                    )
+                    status, response_headers, body = self.respond(
+                        method, target, headers
+                    )
+                except ValueError:
+                    method, version = "GET", "HTTP/1.0"
+                    status, response_headers, body = 400, {}, b""
+
+                keep_alive = (
+                    version == "HTTP/1.1"
+                    and headers.get("connection", "").lower() != "close"
+                )
+                response_headers["Content-Length"] = str(len(body))
+                response_headers["Connection"] = "keep-alive" if keep_alive else "close"
+                head = f"HTTP/1.1 {status} {REASONS[status]}\r\n" + "".join(
+                    f"{key}: {value}\r\n" for key, value in response_headers.items()
+                )
+                writer.write(head.encode("latin-1") + b"\r\n")
+                if method != "HEAD":
+                    writer.write(body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # the client left mid-request, or sent a line over the stream limit
+            pass
+        finally:
+            writer.close()
+
+    async def refresh_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh)
+            # the loader may crawl or read from disk, keep it off the event loop
+            try:
+                snapshot = await asyncio.to_thread(self.loader)
+            except Exception:
+                # keep serving the previous snapshot until the next refresh
+                continue
+            self.snapshot = snapshot
+            self.cache.clear()
+
+    async def serve(self) -> None:
+        self.snapshot = await asyncio.to_thread(self.loader)
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        refresh = asyncio.create_task(self.refresh_forever()) if self.refresh else None
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if refresh is not None:
+                refresh.cancel()
+
+    def run(self) -> None:
+        asyncio.run(self.serve())
+
+
+if __name__ == "__main__":
+    CatalogueServer(Snapshot.from_crawl).run()
@@ -8,6 +8,16 @@ BULKBARN_PRODUCT_BASE_URL = "https://www.bulkbarn.ca/en/Products/All/"
 BULKBARN_STORES_URL = "https://www.bulkbarn.ca/store_selector/en/"
 BULKBARN_ECOMM_URL = "https://www.bulkbarn.ca/ecomm/product_search.html"
 
+# Province codes used by the store selector and the ecomm PST flags
+PROVINCES = ["AB", "BC", "MB", "NB", "NL", "NS", "NT", "ON", "PE", "QC", "SK"]
+
+
+def province_from_address(address, default=None):
+    """Finds the province code in a store address, default when there is none"""
+    for token in reversed(address.upper().replace(",", " ").split()):
+        if token in PROVINCES:
+            return token
+    return default
 
 def metric_conversion(lb):
     """Converts pounds to kilograms"""
@@ -0,0 +1,167 @@
+from bulkbarn.crawl import Crawler
+from bulkbarn.crawl import CrawlQueue
+from bulkbarn.crawl import DONE
+from bulkbarn.crawl import FAILED
+from bulkbarn.crawl import PENDING
+from bulkbarn.crawl import run_workers
+
+
+class FakeBulkBarn:
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.fetched = []
+
+    def get_categories(self):
+        return [{"name": "Baking", "url": "https://example.com/baking", "id": "1"}]
+
+    def get_category_products(self, url):
+        self.fetched.append(url)
+        return [
+            {"name": "Flour", "url": "https://example.com/flour", "id": "276"},
+            {"name": "Sugar", "url": "https://example.com/sugar", "id": "277"},
+        ]
+
+    def get_products_details(self, url):
+        self.fetched.append(url)
+        if url == self.fail_on:
+            raise ConnectionError(url)
+        return {"name": url.split("/")[-1]}
+
+    def get_recipes_categories(self):
+        return []
+
+    def get_store_locations(self):
+        return [{"store_id": 741}]
+
+
+class FlakyBulkBarn(FakeBulkBarn):
+    """Fails the first request of every product, like a short outage."""
+
+    def get_products_details(self, url):
+        if url not in self.fetched:
+            self.fetched.append(url)
+            raise ConnectionError(url)
+        return super().get_products_details(url)
+
+
+def test_queue_claims_each_task_once(tmp_path):
+    queue = CrawlQueue(str(tmp_path / "crawl.db"))
+
+    assert queue.put("https://example.com/a", "product")
+    assert not queue.put("https://example.com/a", "product")
+
+    task = queue.claim("worker-1")
+    assert task == {"url": "https://example.com/a", "kind": "product"}
+    assert queue.claim("worker-2") is None
+
+
+def test_queue_reclaims_expired_lease(tmp_path):
+    queue = CrawlQueue(str(tmp_path / "crawl.db"), lease=0)
+    queue.put("https://example.com/a", "product")
+
+    assert queue.claim("crashed-worker") is not None
+    assert queue.claim("worker-2") == {
+        "url": "https://example.com/a",
+        "kind": "product",
+    }
+
+
+def test_crawler_resumes_after_failure(tmp_path):
+    path = str(tmp_path / "crawl.db")
+    bulkbarn = FakeBulkBarn(fail_on="https://example.com/sugar")
+    crawler = Crawler(bulkbarn, path, max_attempts=1)
+    crawler.seed()
+    crawler.run()
+
+    assert crawler.queue.counts() == {DONE: 5, FAILED: 1}
+    # too many failures, readers keep the previous generation
+    assert crawler.queue.finished_generation() is None
+
+    # a new process on the same queue only fetches what is left
+    resumed = Crawler(FakeBulkBarn(), path)
+    resumed.seed()
+    assert resumed.queue.retry_failed() == 1
+    assert resumed.queue.counts()[PENDING] == 1
+    resumed.run()
+    assert resumed.bulkbarn.fetched == ["https://example.com/sugar"]
+
+    resumed.load()
+    assert len(resumed.bulkbarn.products) == 2
+    assert len(resumed.bulkbarn.products_details) == 2
+    assert resumed.bulkbarn.store_locations == [{"store_id": 741}]
+
+
+def test_start_new_crawls_again(tmp_path):
+    path = str(tmp_path / "crawl.db")
+    crawler = Crawler(FakeBulkBarn(), path)
+    crawler.seed()
+    assert crawler.run() == 6
+    assert crawler.queue.finished_generation() == crawler.queue.generation
+
+    # resuming a finished crawl has nothing left to do
+    resumed = Crawler(FakeBulkBarn(), path)
+    resumed.seed()
+    assert resumed.run() == 0
+
+    nightly = Crawler(FakeBulkBarn(), path)
+    generation = nightly.start_new()
+    assert nightly.queue.finished_generation() == generation - 1
+    assert nightly.run() == 6
+    assert nightly.queue.finished_generation() == generation
+
+
+def test_tasks_of_dead_workers_are_recovered(tmp_path):
+    queue = CrawlQueue(str(tmp_path / "crawl.db"), max_attempts=2)
+    queue.put("https://example.com/a", "product")
+
+    # a pid that cannot be running on this host
+    assert queue.claim("host:999999999") is not None
+    assert queue.recover("host") == 1
+    assert queue.claim("host:999999999") is not None
+
+    # the task crashed its worker max_attempts times, it is not retried
+    queue.recover("host")
+    assert queue.claim("host:1") is None
+    assert queue.counts() == {FAILED: 1}
+
+
+def test_failed_tasks_wait_before_retry(tmp_path):
+    queue = CrawlQueue(str(tmp_path / "crawl.db"), backoff=60)
+    queue.put("https://example.com/a", "product")
+
+    queue.claim("worker-1")
+    queue.fail("https://example.com/a", "ConnectionError()")
+    assert queue.claim("worker-1") is None
+    assert queue.counts() == {PENDING: 1}
+
+
+def test_crawler_survives_short_outage(tmp_path):
+    crawler = Crawler(FlakyBulkBarn(), str(tmp_path / "crawl.db"), backoff=0.05)
+    crawler.seed()
+
+    assert crawler.run(poll=0.01) == 6
+    assert crawler.queue.counts() == {DONE: 6}
+    assert crawler.queue.finished_generation() == crawler.queue.generation
+
+
+def test_run_workers_resumes_or_starts_new(tmp_path):
+    path = str(tmp_path / "crawl.db")
+    interrupted = Crawler(FakeBulkBarn(), path)
+    interrupted.seed()
+    interrupted.run(limit=2)
+    interrupted.queue.close()
+
+    # the interrupted crawl is finished by a pool of processes
+    assert run_workers(FakeBulkBarn, path, workers=3) == 4
+    queue = CrawlQueue(path)
+    assert queue.generation == 1
+    assert queue.finished_generation() == 1
+    assert queue.counts() == {DONE: 6}
+    queue.close()
+
+    # the same command on a finished crawl starts a new one
+    assert run_workers(FakeBulkBarn, path, workers=3) == 6
+    queue = CrawlQueue(path)
+    assert queue.finished_generation() == 2
+    assert len(queue.results("product")) == 2
+    queue.close()
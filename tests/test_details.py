@@ -0,0 +1,95 @@
+import pytest
+from bulkbarn.details import extract_product_details
+from bulkbarn.details import ExtractionError
+
+PAGE = """
+<section id="products-content">
+  <ul>
+    <li class="normalscale centered blowup currentDisplayItem"
+        data-blowup-content="/images/276.png"></li>
+  </ul>
+  <div class="greystripe product-detail-card [nutrition-status]">
+    <p class="prod-name">Not the product card</p>
+  </div>
+  <div class="greystripe product-detail-card [nutrition-status]">
+    <p class="prod-name"> Self-Rising Flour </p>
+    <p class="prod-desc">276</p>
+    <p class="prod-price">$0.44 / 100g</p>
+    <ul><li class="list-ind-vegan">Vegan</li></ul>
+    <p class="prod-ing">Wheat flour, baking powder, salt.</p>
+  </div>
+</section>
+<section class="product_detail_copy product-description-template-target">
+  <p>Serving Size 1/4 cup
+Portion 30 g</p>
+  <div class="newrow border-bottom"><span>Calories 100</span><span></span></div>
+  <div class="newrow border-bottom"><span>Fat / Lipides 0.5 g</span><span>1 %</span></div>
+  <div class="newrow border-bottom"><span>Sodium 380 mg</span><span>16 %</span></div>
+  <div class="newrow border-bottom"><span>Iron / Fer</span><span>8 %</span></div>
+</section>
+"""
+
+
+def test_extract_product_details():
+    details = extract_product_details(PAGE)
+
+    assert details["name"] == "Self-Rising Flour"
+    assert details["bbPLU"] == "276"
+    assert details["price"] == "$0.44 / 100g"
+    assert details["image"] == "https://www.bulkbarn.ca/images/276.png"
+    assert details["details"]["Dietary Information"]["Vegan"] == "Vegan"
+    assert details["details"]["Dietary Information"]["Organic"] == ""
+    assert details["details"]["Ingredients"] == "Wheat flour, baking powder, salt."
+    assert details["errors"] == []
+
+    nutrition_facts = details["nutrition_facts"]
+    assert nutrition_facts["Serving Size"] == "1/4 cup"
+    assert nutrition_facts["Portion"] == "30 g"
+    assert nutrition_facts["Calories"] == ""
+    assert nutrition_facts["Fat"]["Total"] == {"Value": "0.5 g", "Percentage": "1"}
+    assert nutrition_facts["Sodium"] == {"Value": "380 mg", "Percentage": "16"}
+    assert nutrition_facts["Iron"] == {"Value": "Iron / Fer", "Percentage": "8"}
+
+
+def test_missing_parts_are_reported():
+    page = PAGE.split('<section class="product_detail_copy')[0]
+    page = page.replace("currentDisplayItem", "")
+
+    details = extract_product_details(page)
+    assert details["name"] == "Self-Rising Flour"
+    assert details["errors"] == [
+        "image",
+        "nutrition_facts / Serving Size",
+        "nutrition_facts",
+    ]
+
+
+def test_not_a_product_page():
+    with pytest.raises(ExtractionError):
+        extract_product_details("<html><body><p>Not found</p></body></html>")
+
+
+def test_image_inside_the_product_card():
+    image = '<li class="normalscale centered blowup currentDisplayItem"'
+    page = PAGE.replace(image, '<li class="other"').replace(
+        '<p class="prod-desc">',
+        image + ' data-blowup-content="/images/card.png"></li><p class="prod-desc">',
+    )
+
+    details = extract_product_details(page)
+    assert details["image"] == "https://www.bulkbarn.ca/images/card.png"
+    assert "image" not in details["errors"]
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("//cdn.bulkbarn.ca/276.png", "https://cdn.bulkbarn.ca/276.png"),
+        ("images/276.png", "https://www.bulkbarn.ca/images/276.png"),
+        ("https://cdn.bulkbarn.ca/276.png", "https://cdn.bulkbarn.ca/276.png"),
+    ],
+)
+def test_image_urls_are_resolved(url, expected):
+    page = PAGE.replace('"/images/276.png"', f'"{url}"')
+
+    assert extract_product_details(page)["image"] == expected
@@ -0,0 +1,99 @@
+from datetime import date
+from datetime import timedelta
+
+from bulkbarn.history import effective_price
+from bulkbarn.history import parse_price
+from bulkbarn.history import PriceHistory
+
+
+def test_parse_price():
+    assert parse_price("$1.81 / 100g") == 1.81
+    assert parse_price("2,50 $") == 2.50
+
+
+def test_effective_price_uses_sale_price_during_sale():
+    item = {
+        "Retail_Price": "1.81",
+        "Sale_Price": "1.18",
+        "Sale_Start_Date": "2020-08-06 00:01",
+        "Sale_End_Date": "2020-08-31 23:59",
+    }
+
+    assert effective_price(item, date(2020, 8, 10)) == 1.18
+    assert effective_price(item, date(2020, 9, 1)) == 1.81
+
+
+def test_unchanged_prices_are_stored_as_runs(tmp_path):
+    history = PriceHistory(str(tmp_path))
+    start = date(2023, 1, 1)
+    for offset in range(59):
+        day = start + timedelta(days=offset)
+        history.record({"129": 1.81 if offset < 40 else 1.18}, day)
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "2023-01.json.gz",
+        "2023-02.json.gz",
+    ]
+    # january, then february before and after the change
+    assert history.load_partition("2023-01") == {"129": [[738521, 738551, 1.81]]}
+    assert len(history.load_partition("2023-02")["129"]) == 2
+
+    series = history.series("129", days=30, end=date(2023, 2, 28))
+    assert len(series) == 30
+    assert series[date(2023, 2, 9)] == 1.81
+    assert series[date(2023, 2, 10)] == 1.18
+
+
+def test_biggest_drops(tmp_path):
+    history = PriceHistory(str(tmp_path))
+    history.record({"129": 2.00, "276": 1.00, "277": 5.00}, date(2023, 5, 1))
+    history.record({"129": 1.00, "276": 0.90, "277": 6.00}, date(2023, 5, 2))
+
+    drops = history.biggest_drops(days=7, end=date(2023, 5, 3))
+    assert list(drops.index) == ["129", "276"]
+    assert drops.loc["129", "percentage"] == -50
+
+
+def test_parse_price_with_thousands_separator():
+    assert parse_price("$1,234.56") == 1234.56
+    assert parse_price("1,81 $ / 100 g") == 1.81
+    assert parse_price("$1,234") == 1234
+    assert parse_price("1 234,56 $") == 1234.56
+    assert parse_price("$1.81 / 100 g") == 1.81
+
+
+def test_first_crawl_of_the_month_compares_with_the_month_before(tmp_path):
+    history = PriceHistory(str(tmp_path))
+
+    assert history.record({"129": 1.81, "276": 2.50}, date(2023, 1, 31)) == 2
+    assert history.record({"129": 1.81, "276": 2.00}, date(2023, 2, 1)) == 1
+
+
+def test_record_items_skips_items_without_price(tmp_path):
+    history = PriceHistory(str(tmp_path))
+    items = [
+        {"BBPLU": "129", "Retail_Price": "1.81"},
+        {"BBPLU": "276", "Retail_Price": ""},
+    ]
+
+    assert history.record_items(items, date(2023, 1, 1)) == 1
+    assert history.load_partition("2023-01") == {"129": [[738521, 738521, 1.81]]}
+
+
+def test_late_observations_are_put_in_place(tmp_path):
+    history = PriceHistory(str(tmp_path))
+    history.record({"129": 1.81}, date(2023, 1, 10))
+
+    assert history.record({"129": 1.50}, date(2023, 1, 5)) == 1
+    assert history.record({"129": 1.50}, date(2023, 1, 7)) == 0
+    assert history.record({"129": 1.81}, date(2023, 1, 12)) == 0
+    # a re-crawl inside a run splits it
+    assert history.record({"129": 1.99}, date(2023, 1, 11)) == 1
+
+    runs = history.runs("129", date(2023, 1, 1), date(2023, 1, 31))
+    assert runs == [
+        (date(2023, 1, 5), date(2023, 1, 7), 1.50),
+        (date(2023, 1, 10), date(2023, 1, 10), 1.81),
+        (date(2023, 1, 11), date(2023, 1, 11), 1.99),
+        (date(2023, 1, 12), date(2023, 1, 12), 1.81),
+    ]
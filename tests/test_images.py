@@ -0,0 +1,76 @@
+import httpx
+import pytest
+from bulkbarn.images import ImageCache
+
+
+def make_client(requests):
+    def handler(request):
+        requests.append(request)
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, content=b"same image", headers={"etag": '"v1"'})
+
+    return httpx.Client(transport=httpx.MockTransport(handler))
+
+
+def test_duplicate_images_are_stored_once(tmp_path):
+    cache = ImageCache(make_client([]), str(tmp_path))
+    paths = cache.download(
+        [
+            "https://example.com/a.png",
+            "https://example.com/b.jpeg",
+            "https://example.com/c",
+            "https://example.com/a.png",
+            "",
+        ]
+    )
+
+    assert len(paths) == 3
+    assert len(set(paths.values())) == 1
+    assert cache.index["https://example.com/b.jpeg"]["content_type"] == "image/jpeg"
+
+
+def test_unchanged_images_are_skipped(tmp_path):
+    requests = []
+    ImageCache(make_client(requests), str(tmp_path)).download(
+        ["https://example.com/a.png"]
+    )
+
+    # a new run reads the index left by the previous one
+    cache = ImageCache(make_client(requests), str(tmp_path))
+    paths = cache.download(["https://example.com/a.png"])
+
+    assert requests[-1].headers["if-none-match"] == '"v1"'
+    assert cache.changed == []
+    assert cache.index["https://example.com/a.png"]["path"] == (
+        paths["https://example.com/a.png"]
+    )
+
+
+def test_index_is_saved_when_a_run_aborts(tmp_path):
+    cache = ImageCache(make_client([]), str(tmp_path), workers=1)
+    store = cache.store
+    stored = []
+
+    def store_once(content):
+        if stored:
+            raise OSError("No space left on device")
+        stored.append(content)
+        return store(content)
+
+    cache.store = store_once
+    with pytest.raises(OSError):
+        cache.download(["https://example.com/a.png", "https://example.com/b.png"])
+
+    # the urls fetched before the error keep their validators
+    assert ImageCache(make_client([]), str(tmp_path)).index.keys() == {
+        "https://example.com/a.png"
+    }
+
+
+def test_not_modified_without_validators_is_an_error(tmp_path):
+    client = httpx.Client(transport=httpx.MockTransport(lambda r: httpx.Response(304)))
+    cache = ImageCache(client, str(tmp_path))
+
+    assert cache.download(["https://example.com/a.png"]) == {}
+    assert cache.index == {}
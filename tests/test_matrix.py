@@ -0,0 +1,146 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from bulkbarn import matrix as matrix_module
+from bulkbarn.matrix import collect_shard
+from bulkbarn.matrix import PriceMatrix
+from bulkbarn.matrix import store_prices
+
+
+def make_item(bbplu, price, not_in_quebec="0"):
+    return {
+        "BBPLU": bbplu,
+        "Retail_Price": price,
+        "Sale_Price": price,
+        "not_in_quebec": not_in_quebec,
+    }
+
+
+def test_store_prices_skips_items_not_in_quebec():
+    items = [make_item("129", "1.81"), make_item("276", "2.50", not_in_quebec="1")]
+
+    assert store_prices(items, "QC") == {"129": 1.81}
+    assert store_prices(items, "ON") == {"129": 1.81, "276": 2.50}
+
+
+def test_price_matrix_shares_identical_price_lists():
+    matrix = PriceMatrix(None, workers=2)
+    first = matrix.add(741, "ON", {"129": 1.81, "276": 2.50})
+    second = matrix.add(527, "ON", {"276": 2.50, "129": 1.81})
+    third = matrix.add(100, "QC", {"129": 1.99})
+
+    assert first == second
+    assert first != third
+    assert len(matrix.price_lists) == 2
+
+    df = matrix.to_dataframe()
+    assert list(df.index) == [100, 527, 741]
+    assert list(df.columns) == ["129", "276"]
+    assert df.loc[741, "276"] == 2.50
+    assert df.loc[100, "276"] != df.loc[100, "276"]  # NaN, not sold in the store
+
+
+def test_shard_spreads_stores_across_workers():
+    matrix = PriceMatrix(None, workers=2)
+    stores = [
+        {"store_id": 741, "address": "741 ALGONQUIN BOULEVARD EAST TIMMINS ON"},
+        {"store_id": 527, "address": "100 RUE PRINCIPALE GATINEAU QC"},
+        {"store_id": 100, "province": "BC"},
+    ]
+
+    assert matrix.shard(stores) == [[(741, "ON"), (100, "BC")], [(527, "QC")]]
+
+
+def test_shard_leaves_out_stores_without_province():
+    matrix = PriceMatrix(None, workers=2)
+    stores = [
+        {"store_id": 741, "address": "741 ALGONQUIN BOULEVARD EAST TIMMINS ON"},
+        {"store_id": 527, "address": "100 RUE PRINCIPALE"},
+    ]
+
+    assert matrix.shard(stores) == [[(741, "ON")], []]
+    assert list(matrix.failed) == [527]
+
+
+class StubContext:
+    def __init__(self, contexts):
+        self.closed = False
+        contexts.append(self)
+
+    def new_page(self):
+        return self
+
+    def close(self):
+        self.closed = True
+
+
+class StubBrowser:
+    def __init__(self):
+        self.contexts = []
+        self.closed = False
+
+    def new_context(self):
+        return StubContext(self.contexts)
+
+    def close(self):
+        self.closed = True
+
+
+class StubPlaywright:
+    def __init__(self, browser):
+        self.chromium = self
+        self.browser = browser
+
+    def launch(self, headless):
+        return self.browser
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class StubBulkBarn:
+    def load_store(self, page, store_id, province):
+        if store_id == 527:
+            raise TimeoutError("store selector not found")
+
+    def get_store_items(self, page):
+        return [make_item("129", "1.81")]
+
+
+def test_collect_shard_keeps_stores_that_did_not_fail(monkeypatch):
+    browser = StubBrowser()
+    monkeypatch.setattr(
+        matrix_module, "sync_playwright", lambda: StubPlaywright(browser)
+    )
+
+    results, failed = collect_shard(
+        StubBulkBarn, [(741, "ON"), (527, "QC"), (100, "BC")], "Retail_Price", True
+    )
+
+    assert results == [(741, "ON", {"129": 1.81}), (100, "BC", {"129": 1.81})]
+    assert list(failed) == [527]
+    assert "TimeoutError" in failed[527]
+    assert all(context.closed for context in browser.contexts)
+    assert browser.closed
+
+
+def test_collect_keeps_shards_that_did_not_fail(monkeypatch):
+    def fake_collect_shard(bulkbarn_cls, shard, price_field, headless):
+        if (527, "QC") in shard:
+            raise RuntimeError("browser crashed")
+        return [(store_id, province, {"129": 1.81}) for store_id, province in shard], {}
+
+    monkeypatch.setattr(matrix_module, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(matrix_module, "collect_shard", fake_collect_shard)
+    stores = [
+        {"store_id": 741, "province": "ON"},
+        {"store_id": 527, "province": "QC"},
+        {"store_id": 100, "province": "BC"},
+    ]
+
+    matrix = PriceMatrix(StubBulkBarn, workers=2).collect(stores)
+    assert sorted(matrix.stores) == [100, 741]
+    assert list(matrix.failed) == [527]
+    assert "browser crashed" in matrix.failed[527]
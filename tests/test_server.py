@@ -0,0 +1,141 @@
+import asyncio
+import sqlite3
+
+import pytest
+from bulkbarn.crawl import CrawlQueue
+from bulkbarn.server import CatalogueServer
+from bulkbarn.server import Snapshot
+
+PRODUCTS = [
+    {"name": "Self-Rising Flour", "url": "", "id": "1", "bbPLU": "276"},
+    {"name": "Icing Sugar", "url": "", "id": "2", "bbPLU": "277"},
+]
+
+
+def make_server():
+    server = CatalogueServer(lambda: Snapshot(PRODUCTS, [], [], []), port=0)
+    server.snapshot = server.loader()
+    return server
+
+
+def test_respond_with_etag():
+    server = make_server()
+    status, headers, body = server.respond("GET", "/products/276", {})
+
+    assert status == 200
+    assert b"Self-Rising Flour" in body
+
+    status, _, body = server.respond(
+        "GET", "/products/276", {"if-none-match": headers["ETag"]}
+    )
+    assert status == 304
+    assert body == b""
+    assert server.respond("GET", "/products/999", {})[0] == 404
+
+
+def test_search_is_cached_per_snapshot():
+    server = make_server()
+    status, _, body = server.respond("GET", "/search?q=flour", {})
+
+    assert status == 200
+    assert b"276" in body and b"277" not in body
+    assert len(server.cache) == 1
+
+    server.respond("GET", "/search?q=FLOUR", {})
+    assert len(server.cache) == 1
+
+
+def test_serve_over_http():
+    async def request():
+        server = make_server()
+        listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /products HTTP/1.1\r\nConnection: close\r\n\r\n")
+        response = await reader.read()
+        listener.close()
+        return response
+
+    response = asyncio.run(request())
+    assert response.startswith(b"HTTP/1.1 200 OK")
+    assert response.endswith(b'Icing Sugar","url":"","id":"2","bbPLU":"277"}]')
+
+
+def test_if_none_match_lists_and_wildcard():
+    server = make_server()
+    _, headers, _ = server.respond("GET", "/products", {})
+
+    for header in ('"other", ' + headers["ETag"], "*", "W/" + headers["ETag"]):
+        assert server.respond("GET", "/products", {"if-none-match": header})[0] == 304
+    assert server.respond("GET", "/products", {"if-none-match": '"other"'})[0] == 200
+
+
+def test_request_body_is_not_read_as_next_request():
+    async def request():
+        server = make_server()
+        listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(
+            b"POST /products HTTP/1.1\r\nContent-Length: 18\r\n\r\n"
+            b"GET /stores HTTP/1"
+            b"GET /categories HTTP/1.1\r\nConnection: close\r\n\r\n"
+        )
+        response = await reader.read()
+        listener.close()
+        return response
+
+    response = asyncio.run(request())
+    assert response.startswith(b"HTTP/1.1 405 Method Not Allowed")
+    assert response.count(b"HTTP/1.1 ") == 2
+    assert response.endswith(b"\r\n\r\n[]")
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"GET /" + b"a" * 100_000 + b" HTTP/1.1\r\n\r\n",
+        b"POST /products HTTP/1.1\r\nContent-Length: 100\r\n\r\nshort",
+    ],
+    ids=["request line too long", "body cut short"],
+)
+def test_broken_requests_close_the_connection(data):
+    errors = []
+
+    async def handle(reader, writer):
+        try:
+            await make_server().handle(reader, writer)
+        except Exception as e:
+            errors.append(e)
+
+    async def request():
+        listener = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(data)
+        writer.write_eof()
+        response = await reader.read()
+        listener.close()
+        return response
+
+    assert asyncio.run(request()) == b""
+    assert errors == []
+
+
+def test_snapshot_only_from_finished_crawl(tmp_path):
+    path = str(tmp_path / "crawl.db")
+    with pytest.raises(sqlite3.OperationalError):
+        Snapshot.from_crawl(path)
+    assert not (tmp_path / "crawl.db").exists()
+
+    queue = CrawlQueue(path)
+    queue.put("https://example.com/baking", "category")
+    queue.claim("worker")
+    queue.complete("https://example.com/baking", PRODUCTS)
+    queue.finish()
+    queue.start_new()
+    queue.put("https://example.com/baking", "category")
+
+    # the new crawl is in progress, readers keep the finished one
+    snapshot = Snapshot.from_crawl(path)
+    assert snapshot.products == PRODUCTS